@@ -0,0 +1,53 @@
+import threading
+from typing import Dict
+import orjson
+
+# 统计信息中实际用到的字段
+STATS_FIELDS = ('cpu_stats', 'precpu_stats', 'memory_stats')
+
+class StatsCollector:
+    """后台持续采集容器统计信息，避免每次请求都阻塞等待采样"""
+
+    def __init__(self):
+        self._latest: Dict[str, dict] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def watch(self, container):
+        """为容器启动后台统计流，已在采集中则跳过"""
+        with self._lock:
+            thread = self._threads.get(container.id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._consume, args=(container,), daemon=True)
+            self._threads[container.id] = thread
+        thread.start()
+
+    def _consume(self, container):
+        """持续读取容器的统计流，只保留最新的一条"""
+        try:
+            # 读取原始字节流并用orjson解析，每条统计以换行结尾
+            buffer = b''
+            for chunk in container.client.api.stats(container.id, stream=True, decode=False):
+                buffer += chunk
+                *lines, buffer = buffer.split(b'\n')
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    s = orjson.loads(line)
+                    # 只保留计算资源使用率所需的字段
+                    sample = {key: s.get(key, {}) for key in STATS_FIELDS}
+                    with self._lock:
+                        self._latest[container.id] = sample
+        except Exception as e:
+            print(f"容器 {container.id[:12]} 统计流中断: {str(e)}")
+        finally:
+            with self._lock:
+                self._latest.pop(container.id, None)
+                self._threads.pop(container.id, None)
+
+    def get(self, container):
+        """返回容器最近一次的统计信息，尚未采集到时返回None"""
+        self.watch(container)
+        with self._lock:
+            return self._latest.get(container.id)
@@ -1,44 +1,61 @@
 import sys
 import argparse
 import json
-import os
 import signal
 import subprocess
 import locale
 import asyncio
 from sandbox import DockerSandbox
-import time
 
 # 检查和安装所需的库
 def ensure_dependencies():
-    try:
-        import websockets
-    except ImportError:
-        print("正在安装必要的库: websockets...")
+    for module_name, package_name in [("websockets", "websockets"), ("prompt_toolkit", "prompt_toolkit")]:
         try:
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "websockets"])
-            print("websockets 安装成功！")
-        except Exception as e:
-            print(f"安装websockets失败: {e}")
-            print("请手动运行: pip install websockets")
-            sys.exit(1)
+            __import__(module_name)
+        except ImportError:
+            print(f"正在安装必要的库: {package_name}...")
+            try:
+                subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
+                print(f"{package_name} 安装成功！")
+            except Exception as e:
+                print(f"安装{package_name}失败: {e}")
+                print(f"请手动运行: pip install {package_name}")
+                sys.exit(1)
+    
+    # uvloop为可选依赖，安装失败时使用默认事件循环
+    if sys.platform != 'win32':
+        try:
+            import uvloop
+        except ImportError:
+            print("正在安装可选库: uvloop...")
+            try:
+                subprocess.check_call([sys.executable, "-m", "pip", "install", "uvloop"])
+                print("uvloop 安装成功！")
+            except Exception as e:
+                print(f"安装uvloop失败，将使用默认事件循环: {e}")
 
 # 确保依赖项已安装
 ensure_dependencies()
 
+from prompt_toolkit import PromptSession
+from prompt_toolkit.formatted_text import ANSI
+
+# 使用uvloop替换默认事件循环（Linux/macOS）
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 # 设置默认编码为UTF-8
 if sys.platform == 'win32':
-    # 尝试设置控制台编码为UTF-8（Windows）
-    os.system('chcp 65001 > NUL')
-    
     # 设置Python的默认编码
     if hasattr(sys, 'setdefaultencoding'):
         sys.setdefaultencoding('utf-8')
     
-    # 设置标准输出/错误的编码
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace', line_buffering=True)
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace', line_buffering=True)
+    # 直接重新配置标准输出/错误的编码，无需启动cmd.exe执行chcp
+    sys.stdout.reconfigure(encoding='utf-8', errors='replace', line_buffering=True)
+    sys.stderr.reconfigure(encoding='utf-8', errors='replace')
 
 # 打印当前环境编码
 print(f"默认编码: {sys.getdefaultencoding()}")
@@ -52,22 +69,73 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-def check_image_exists(image_name):
+# 镜像检查结果缓存，进程内同一镜像只检查一次
+_image_cache: dict[str, bool] = {}
+
+
+def check_image_exists(sandbox):
     """检查Docker镜像是否存在"""
-    try:
-        # 显式设置encoding参数为utf-8
-        result = subprocess.run(
-            ["docker", "images", "-q", image_name],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=False
-        )
-        return bool(result.stdout.strip())
-    except Exception as e:
-        print(f"检查Docker镜像时出错: {e}")
-        return False
+    if sandbox.image_name in _image_cache:
+        return _image_cache[sandbox.image_name]
+    
+    exists = sandbox.check_image_exists()
+    _image_cache[sandbox.image_name] = exists
+    return exists
+
+
+async def repl(sandbox):
+    """交互模式主循环，用户输入与WebSocket通信共用同一个事件循环"""
+    session = PromptSession()
+    
+    while True:
+        try:
+            # 获取用户输入，等待期间事件循环仍可处理心跳等后台任务
+            user_input = await session.prompt_async(ANSI("\033[1m>>> \033[0m"))
+            
+            # 检查退出命令
+            if user_input.lower() in ["exit", "quit", "q", "退出"]:
+                print("退出交互模式。")
+                break
+            
+            if not user_input.strip():
+                continue
+            
+            # 发送消息到沙箱
+            print("发送中...\n")
+            try:
+                result = await sandbox.run_interpreter(user_input)
+                
+                if result["success"]:
+                    if not result.get("stdout"):
+                        print("(沙箱执行成功，但没有输出)")
+                else:
+                    print("\n--- 执行错误 ---")
+                    error_msg = result.get("error", "未知错误")
+                    print(f"错误: {error_msg}")
+                    if result.get("stderr"):
+                        print("详细错误信息:")
+                        print(result["stderr"])
+            except Exception as e:
+                print(f"\n发送消息出错: {e}")
+                print("正在尝试恢复...")
+                await asyncio.sleep(3)  # 出错后等待更长时间
+            
+        except EOFError:
+            print("退出交互模式。")
+            break
+        except KeyboardInterrupt:
+            try:
+                choice = await session.prompt_async("\n\n是否要退出程序? (y/n): ")
+            except (KeyboardInterrupt, EOFError):
+                # 确认时再次按Ctrl+C或Ctrl+D视为确认退出
+                choice = 'y'
+            if choice.lower() in ['y', 'yes', '是']:
+                print("退出程序。")
+                break
+            print("继续执行。")
+        except Exception as e:
+            print(f"发生错误: {e}")
+            print("尝试继续执行...")
 
 
 def main():
@@ -88,6 +156,11 @@ def main():
     
     args = parser.parse_args()
     
+    # 整个会话共用一个事件循环，WebSocket连接可跨消息复用
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    sandbox = None
+    
     try:
         # 创建沙箱实例
         sandbox = DockerSandbox(
@@ -99,9 +172,8 @@ def main():
             debug=args.debug
         )
         
-        # 检查镜像是否存在，不存在则构建
-        image_exists = check_image_exists(args.image)
-        if args.build or not image_exists:
+        # 检查镜像是否存在，不存在则构建（强制构建时无需检查）
+        if args.build or not check_image_exists(sandbox):
             if args.build:
                 print(f"正在强制重新构建Docker镜像: {args.image}...")
             else:
@@ -120,57 +192,7 @@ def main():
             print("输入 'exit' 或 'quit' 退出，按Ctrl+C中断。")
             print("示例命令: '计算1+1'，'帮我画一个圆形'\n")
             
-            while True:
-                try:
-                    # 获取用户输入
-                    user_input = input("\033[1m>>> \033[0m")
-                    
-                    # 检查退出命令
-                    if user_input.lower() in ["exit", "quit", "q", "退出"]:
-                        print("退出交互模式。")
-                        break
-                    
-                    if not user_input.strip():
-                        continue
-                    
-                    # 发送消息到沙箱
-                    print("发送中...\n")
-                    try:
-                        # 创建事件循环
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        
-                        # 运行异步函数
-                        result = loop.run_until_complete(sandbox.run_interpreter(user_input))
-                        loop.close()
-                        
-                        if result["success"]:
-                            if not result.get("stdout"):
-                                print("(沙箱执行成功，但没有输出)")
-                        else:
-                            print("\n--- 执行错误 ---")
-                            error_msg = result.get("error", "未知错误")
-                            print(f"错误: {error_msg}")
-                            if result.get("stderr"):
-                                print("详细错误信息:")
-                                print(result["stderr"])
-                        
-                        # 消息间隔，避免过快发送请求
-                        time.sleep(1)
-                    except Exception as e:
-                        print(f"\n发送消息出错: {e}")
-                        print("正在尝试恢复...")
-                        time.sleep(3)  # 出错后等待更长时间
-                    
-                except KeyboardInterrupt:
-                    choice = input("\n\n是否要退出程序? (y/n): ")
-                    if choice.lower() in ['y', 'yes', '是']:
-                        print("退出程序。")
-                        break
-                    print("继续执行。")
-                except Exception as e:
-                    print(f"发生错误: {e}")
-                    print("尝试继续执行...")
+            loop.run_until_complete(repl(sandbox))
         
         else:
             # 显示帮助信息
@@ -179,6 +201,12 @@ def main():
     except Exception as e:
         print(f"程序执行过程中发生错误: {e}", file=sys.stderr)
         sys.exit(1)
+    
+    finally:
+        # 退出时才关闭WebSocket连接和事件循环
+        if sandbox is not None:
+            loop.run_until_complete(sandbox.close())
+        loop.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,18 +1,59 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template
+import functools
 import docker
-import psutil
+import orjson
 import time
+import threading
+from datetime import datetime, timezone
+from container_stats import StatsCollector
 from sandbox import DockerSandbox
 
 app = Flask(__name__)
 docker_client = docker.from_env()
 
-# 初始化沙箱实例
-sandbox = DockerSandbox()
+@functools.lru_cache(maxsize=None)
+def _sandbox():
+    """延迟创建沙箱实例，避免在模块导入（包括reloader重复导入）时初始化"""
+    return DockerSandbox()
 
-def get_container_info():
+def _find_container_id():
+    """按镜像查找实际运行中的沙箱容器，本进程不会自己启动容器
+    
+    结果只保存在局部变量中，不修改共享的沙箱实例，并发请求之间互不影响。
+    
+    返回:
+        运行中的沙箱容器ID，没有时返回None
+    """
+    containers = docker_client.containers.list(
+        filters={"ancestor": _sandbox().image_name, "status": "running"},
+        sparse=True
+    )
+    return containers[0].id if containers else None
+
+stats_collector = StatsCollector()
+
+# 容器对象缓存的有效期（秒），同一次请求内的多个helper共用一次inspect
+CONTAINER_CACHE_TTL = 1.0
+_cached_container = None
+_cached_at = 0.0
+_container_lock = threading.Lock()
+
+def _get_container(container_id):
+    """返回沙箱容器对象，缓存过期或容器变化时才重新inspect"""
+    global _cached_container, _cached_at
+    with _container_lock:
+        now = time.monotonic()
+        if _cached_container is None or _cached_container.id != container_id:
+            _cached_container = docker_client.containers.get(container_id)
+            _cached_at = now
+        elif now - _cached_at > CONTAINER_CACHE_TTL:
+            _cached_container.reload()
+            _cached_at = now
+        return _cached_container
+
+def get_container_info(container_id):
     """获取容器基本信息"""
-    if not sandbox.container_id:
+    if not container_id:
         return {
             'status': 'stopped',
             'id': '-',
@@ -20,7 +61,7 @@ def get_container_info():
         }
     
     try:
-        container = docker_client.containers.get(sandbox.container_id)
+        container = _get_container(container_id)
         container_info = container.attrs
         
         # 获取容器状态
@@ -29,8 +70,9 @@ def get_container_info():
             # 计算运行时间
             start_time = container_info['State']['StartedAt']
             if start_time:
-                start_timestamp = time.strptime(start_time.split('.')[0], '%Y-%m-%dT%H:%M:%S')
-                uptime_seconds = time.time() - time.mktime(start_timestamp)
+                # StartedAt为UTC时间，小数部分为纳秒精度，直接去掉
+                start_dt = datetime.fromisoformat(start_time.split('.')[0]).replace(tzinfo=timezone.utc)
+                uptime_seconds = (datetime.now(timezone.utc) - start_dt).total_seconds()
                 uptime = f"{int(uptime_seconds // 3600)}小时{int((uptime_seconds % 3600) // 60)}分钟"
             else:
                 uptime = '-'
@@ -50,19 +92,27 @@ def get_container_info():
             'uptime': '-'
         }
 
-def get_resource_usage():
+def get_resource_usage(container_id):
     """获取资源使用情况"""
-    if not sandbox.container_id:
+    if not container_id:
         return {
             'cpu': 0,
             'memory': 0,
             'memoryUsed': '0MB',
-            'memoryLimit': sandbox.memory_limit
+            'memoryLimit': _sandbox().memory_limit
         }
     
     try:
-        container = docker_client.containers.get(sandbox.container_id)
-        stats = container.stats(stream=False)
+        container = _get_container(container_id)
+        stats = stats_collector.get(container)
+        if not stats:
+            # 统计流刚建立，尚未收到第一条采样
+            return {
+                'cpu': 0,
+                'memory': 0,
+                'memoryUsed': '0MB',
+                'memoryLimit': _sandbox().memory_limit
+            }
         
         # 计算CPU使用率
         cpu_delta = stats['cpu_stats']['cpu_usage']['total_usage'] - \
@@ -89,20 +139,20 @@ def get_resource_usage():
             'cpu': 0,
             'memory': 0,
             'memoryUsed': '0MB',
-            'memoryLimit': sandbox.memory_limit
+            'memoryLimit': _sandbox().memory_limit
         }
 
-def get_security_config():
+def get_security_config(container_id):
     """获取安全配置状态"""
     try:
-        if not sandbox.container_id:
+        if not container_id:
             return {
                 'readOnly': False,
                 'networkMode': 'bridge',
                 'capsDropped': False
             }
             
-        container = docker_client.containers.get(sandbox.container_id)
+        container = _get_container(container_id)
         container_info = container.attrs
         
         # 检查只读文件系统
@@ -128,6 +178,10 @@ def get_security_config():
             'capsDropped': False
         }
 
+def ojsonify(obj):
+    """使用orjson序列化JSON响应，替代标准库实现的jsonify"""
+    return app.response_class(orjson.dumps(obj), mimetype='application/json')
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -136,13 +190,14 @@ def index():
 def get_status():
     """获取Docker容器的完整状态信息"""
     try:
-        return jsonify({
-            'container': get_container_info(),
-            'resources': get_resource_usage(),
-            'security': get_security_config()
+        container_id = _find_container_id()
+        return ojsonify({
+            'container': get_container_info(container_id),
+            'resources': get_resource_usage(container_id),
+            'security': get_security_config(container_id)
         })
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             'error': f'获取状态信息失败: {str(e)}'
         }), 500
 
@@ -1,8 +1,10 @@
 import os
-import subprocess
 import logging
 import time
-from typing import Dict, Any
+import re
+from typing import Dict, Any, List
+import docker
+import requests
 from websocket_client import WebSocketClient
 
 # 设置日志
@@ -12,6 +14,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger("sandbox")
 
+# run_batch使用的驱动脚本：逐段exec代码，并在stdout/stderr中写入分隔标记和退出状态
+_BATCH_DRIVER = """
+import sys, traceback
+for index, source in enumerate({scripts}):
+    for stream in (sys.stdout, sys.stderr):
+        print(f"---BEGIN {{index}}---", file=stream, flush=True)
+    status = 0
+    try:
+        exec(compile(source, f"<script {{index}}>", "exec"), {{"__name__": "__main__"}})
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    for stream in (sys.stdout, sys.stderr):
+        print(f"---END {{index}} {{status}}---", file=stream, flush=True)
+"""
+_BATCH_SECTION = re.compile(r"---BEGIN (\d+)---\n(.*?)---END \1 (-?\d+)---\n", re.DOTALL)
+
 
 class DockerSandbox:
     """Docker沙箱环境，用于安全地运行代码，并通过WebSocket连接与容器通信"""
@@ -34,7 +55,8 @@ class DockerSandbox:
                  cap_add: list = None,    # 需要添加的Linux capabilities
                  read_only: bool = False,  # 是否启用只读文件系统
                  volumes: dict = None,    # 挂载卷配置 {host_path: container_path}
-                 seccomp_profile: str = None):  # 系统调用限制配置文件路径
+                 seccomp_profile: str = None,  # 系统调用限制配置文件路径
+                 reuse_container: str = None):  # 复用已运行容器的ID或名称
         """初始化Docker沙箱
         
         参数:
@@ -53,6 +75,7 @@ class DockerSandbox:
             read_only: 是否启用只读文件系统
             volumes: 挂载卷配置字典
             seccomp_profile: 系统调用限制配置文件路径
+            reuse_container: 已运行容器的ID或名称，设置后run_code通过exec在其中执行
         """
         self.image_name = image_name
         self.cpu_limit = cpu_limit
@@ -71,6 +94,54 @@ class DockerSandbox:
         self.read_only = read_only
         self.volumes = volumes if volumes else {}
         self.seccomp_profile = seccomp_profile
+        self.reuse_container = reuse_container
+        
+        # 直接通过Docker SDK访问守护进程，避免每次fork docker命令行
+        self._client = docker.from_env()
+        # 已解析的镜像对象，检查或构建镜像后设置
+        self._image = None
+        
+        # 容器启动参数在初始化后不再变化，预先构建一次供start_container复用
+        self._run_kwargs = {
+            "detach": True,  # 后台运行
+            "ports": {"8000/tcp": self.host_port},
+            "nano_cpus": int(float(self.cpu_limit) * 1e9),
+            "mem_limit": self.memory_limit,
+            "pids_limit": 100,  # 限制进程数
+        }
+        
+        # 添加用户和组ID映射
+        if self.user_id:
+            self._run_kwargs["user"] = self.user_id
+        if self.group_id:
+            self._run_kwargs["group_add"] = [self.group_id]
+            
+        # 添加网络模式配置
+        self._run_kwargs["network_mode"] = self.network_mode
+        
+        # 添加capabilities控制
+        self._run_kwargs["cap_drop"] = self.cap_drop
+        self._run_kwargs["cap_add"] = self.cap_add
+            
+        # 添加文件系统权限控制
+        if self.read_only:
+            self._run_kwargs["read_only"] = True
+        
+        # 添加必要的临时文件系统挂载点
+        self._run_kwargs["tmpfs"] = {
+            "/tmp": "exec,mode=777",
+            "/var/tmp": "exec,mode=777",
+            "/run": "exec,mode=777"
+        }
+        
+        # 添加自定义卷挂载
+        if self.volumes:
+            self._run_kwargs["volumes"] = [f"{host_path}:{container_path}"
+                                           for host_path, container_path in self.volumes.items()]
+            
+        # 添加系统调用限制配置
+        if self.seccomp_profile:
+            self._run_kwargs["security_opt"] = [f"seccomp={self.seccomp_profile}"]
         
         # 设置日志级别
         if debug:
@@ -95,6 +166,22 @@ class DockerSandbox:
         
         logger.info(f"Using Dockerfile at: {self.dockerfile_path}")
     
+    def check_image_exists(self) -> bool:
+        """检查Docker镜像是否存在
+        
+        返回:
+            镜像是否存在
+        """
+        try:
+            # 一次请求同时完成存在性检查并取得镜像对象
+            self._image = self._client.images.get(self.image_name)
+            return True
+        except docker.errors.ImageNotFound:
+            return False
+        except Exception as e:
+            logger.error(f"检查Docker镜像时出错: {e}")
+            return False
+    
     def build_image(self) -> bool:
         """构建Docker镜像
         
@@ -105,27 +192,18 @@ class DockerSandbox:
             logger.info(f"Building Docker image: {self.image_name}")
             dockerfile_dir = os.path.dirname(self.dockerfile_path)
             
-            build_cmd = [
-                "docker", "build", 
-                "-t", self.image_name,
-                "-f", self.dockerfile_path,
-                dockerfile_dir
-            ]
-            
-            logger.info(f"Running command: {' '.join(build_cmd)}")
-            result = subprocess.run(
-                build_cmd,
-                check=True,
-                capture_output=True,
-                text=True
+            self._image, build_logs = self._client.images.build(
+                path=dockerfile_dir,
+                dockerfile=self.dockerfile_path,
+                tag=self.image_name
             )
             
-            logger.info(f"Build output: {result.stdout}")
+            logger.info(f"Build output: {''.join(chunk.get('stream', '') for chunk in build_logs)}")
             return True
         
-        except subprocess.CalledProcessError as e:
+        except docker.errors.BuildError as e:
             logger.error(f"Failed to build image: {e}")
-            logger.error(f"Build error output: {e.stderr}")
+            logger.error(f"Build error output: {''.join(chunk.get('stream', '') for chunk in e.build_log)}")
             return False
         
         except Exception as e:
@@ -142,24 +220,17 @@ class DockerSandbox:
             # 检查是否有正在运行的容器
             if self.container_id:
                 # 检查指定ID的容器
-                cmd = ["docker", "ps", "-q", "-f", f"id={self.container_id}", "-f", "status=running"]
+                filters = {"id": self.container_id, "status": "running"}
             else:
                 # 检查基于镜像名称的容器
-                cmd = ["docker", "ps", "-q", "-f", f"ancestor={self.image_name}", "-f", "status=running"]
+                filters = {"ancestor": self.image_name, "status": "running"}
             
-            result = subprocess.run(
-                cmd,
-                check=False,
-                capture_output=True,
-                text=True
-            )
-            
-            container_ids = result.stdout.strip().split('\n')
-            container_ids = [cid for cid in container_ids if cid]  # 过滤空行
+            # sparse=True 只返回列表结果，不再逐个inspect容器
+            containers = self._client.containers.list(filters=filters, sparse=True)
             
-            if container_ids:
+            if containers:
                 # 如果找到了容器，保存第一个容器ID
-                self.container_id = container_ids[0]
+                self.container_id = containers[0].id
                 logger.debug(f"找到运行中的容器: {self.container_id}")
                 return True
             else:
@@ -178,71 +249,23 @@ class DockerSandbox:
         """
         try:
             # 创建一个Docker容器，运行interpreter服务器
-            command = [
-                "docker", "run", "-d",  # 后台运行
-                "-p", f"{self.host_port}:8000",
-                "--cpus", self.cpu_limit,
-                "--memory", self.memory_limit,
-                "--pids-limit=100",  # 限制进程数
-            ]
-            
-            # 添加用户和组ID映射
-            if self.user_id:
-                command.extend(["--user", self.user_id])
-            if self.group_id:
-                command.extend(["--group-add", self.group_id])
-                
-            # 添加网络模式配置
-            command.extend(["--network", self.network_mode])
-            
-            # 添加capabilities控制
-            for cap in self.cap_drop:
-                command.extend(["--cap-drop", cap])
-            for cap in self.cap_add:
-                command.extend(["--cap-add", cap])
-                
-            # 添加文件系统权限控制
-            if self.read_only:
-                command.append("--read-only")
-            
-            # 添加必要的临时文件系统挂载点
-            command.extend([
-                "--tmpfs", "/tmp:exec,mode=777",
-                "--tmpfs", "/var/tmp:exec,mode=777",
-                "--tmpfs", "/run:exec,mode=777"
-            ])
-            
-            # 添加自定义卷挂载
-            for host_path, container_path in self.volumes.items():
-                command.extend(["-v", f"{host_path}:{container_path}"])
-                
-            # 添加系统调用限制配置
-            if self.seccomp_profile:
-                command.extend(["--security-opt", f"seccomp={self.seccomp_profile}"])
-            
-            # 添加镜像名称
-            command.append(self.image_name)
+            logger.info(f"启动容器: {self.image_name} {self._run_kwargs}")
             
-            logger.info(f"启动容器: {' '.join(command)}")
-            
-            result = subprocess.run(
-                command,
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            # 已解析过镜像时直接使用镜像ID，无需再按名称查找
+            image = self._image.id if self._image else self.image_name
+            container = self._client.containers.run(image, **self._run_kwargs)
             
             # 获取容器ID
-            self.container_id = result.stdout.strip()
+            self.container_id = container.id
             logger.info(f"容器启动成功，ID: {self.container_id}")
             
             # 等待容器内的服务启动
             time.sleep(2)
             return True
             
-        except subprocess.CalledProcessError as e:
+        except docker.errors.APIError as e:
             logger.error(f"启动容器失败: {e}")
-            logger.error(f"错误输出: {e.stderr}")
+            logger.error(f"错误输出: {e.explanation}")
             return False
         except Exception as e:
             logger.error(f"启动容器时出错: {e}")
@@ -260,25 +283,157 @@ class DockerSandbox:
             
         try:
             logger.info(f"正在停止容器: {self.container_id}")
-            result = subprocess.run(
-                ["docker", "stop", self.container_id],
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            self._client.containers.get(self.container_id).stop()
             
             logger.info(f"容器已停止: {self.container_id}")
             self.container_id = None
             return True
             
-        except subprocess.CalledProcessError as e:
+        except docker.errors.APIError as e:
             logger.error(f"停止容器失败: {e}")
-            logger.error(f"错误输出: {e.stderr}")
+            logger.error(f"错误输出: {e.explanation}")
             return False
         except Exception as e:
             logger.error(f"停止容器时出错: {e}")
             return False
     
+    def run_code(self, code: str, env: Dict[str, str] = None, timeout: int = None) -> Dict[str, Any]:
+        """在沙箱中执行一段Python代码
+        
+        参数:
+            code: 要执行的Python代码
+            env: 额外的环境变量
+            timeout: 本次执行的超时时间（秒），默认使用self.timeout
+            
+        返回:
+            包含执行结果的字典
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if self.reuse_container:
+            return self._exec_code(code, env, timeout)
+        return self._run_code_in_new_container(code, env, timeout)
+    
+    def run_batch(self, scripts: List[str], env: Dict[str, str] = None) -> List[Dict[str, Any]]:
+        """在同一次执行中依次运行多段Python代码，按分隔标记拆分各自的输出
+        
+        参数:
+            scripts: 要执行的Python代码列表
+            env: 额外的环境变量，所有代码共用
+            
+        返回:
+            与scripts一一对应的执行结果列表
+        """
+        result = self.run_code(_BATCH_DRIVER.format(scripts=repr(scripts)), env)
+        stdout_parts = {int(index): (output, int(status))
+                        for index, output, status in _BATCH_SECTION.findall(result.get("stdout", ""))}
+        stderr_parts = {int(index): output
+                        for index, output, _ in _BATCH_SECTION.findall(result.get("stderr", ""))}
+        
+        results = []
+        for index in range(len(scripts)):
+            if index not in stdout_parts:
+                # 批量执行中途失败（如超时或容器被杀死），之后的代码都没有结果
+                results.append({
+                    "success": False,
+                    "error": result.get("error", "批量执行未完成"),
+                    "stdout": "",
+                    "stderr": stderr_parts.get(index, "")
+                })
+                continue
+            output, status = stdout_parts[index]
+            results.append({
+                "success": status == 0,
+                "stdout": output,
+                "stderr": stderr_parts.get(index, ""),
+                "exit_code": status
+            })
+        return results
+    
+    def _exec_code(self, code: str, env: Dict[str, str], timeout: int) -> Dict[str, Any]:
+        """通过exec在已运行的容器中执行代码，省去每次创建容器的开销"""
+        try:
+            container = self._client.containers.get(self.reuse_container)
+            # exec没有超时参数，借助容器内的timeout命令限制执行时间
+            exit_code, (stdout, stderr) = container.exec_run(
+                ["timeout", str(timeout), "python", "-c", code],
+                environment=env,
+                demux=True
+            )
+            stdout = stdout.decode('utf-8', errors='replace') if stdout else ""
+            stderr = stderr.decode('utf-8', errors='replace') if stderr else ""
+            
+            # timeout命令在超时时以124退出
+            if exit_code == 124:
+                return {
+                    "success": False,
+                    "error": f"Execution timed out after {timeout} seconds",
+                    "stdout": stdout,
+                    "stderr": stderr
+                }
+            
+            return {
+                "success": exit_code == 0,
+                "stdout": stdout,
+                "stderr": stderr,
+                "exit_code": exit_code
+            }
+            
+        except Exception as e:
+            logger.error(f"在容器中执行代码时出错: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _run_code_in_new_container(self, code: str, env: Dict[str, str], timeout: int) -> Dict[str, Any]:
+        """在新建的一次性容器中执行代码，执行结束后删除容器"""
+        container = None
+        try:
+            # 一次性容器不需要映射WebSocket端口
+            run_kwargs = {key: value for key, value in self._run_kwargs.items() if key != "ports"}
+            image = self._image.id if self._image else self.image_name
+            container = self._client.containers.run(
+                image,
+                ["-c", code],
+                entrypoint="python",
+                environment=env,
+                **run_kwargs
+            )
+            
+            try:
+                exit_code = container.wait(timeout=timeout)["StatusCode"]
+            except requests.exceptions.RequestException:
+                container.kill()
+                return {
+                    "success": False,
+                    "error": f"Execution timed out after {timeout} seconds"
+                }
+            
+            return {
+                "success": exit_code == 0,
+                "stdout": container.logs(stdout=True, stderr=False).decode('utf-8', errors='replace'),
+                "stderr": container.logs(stdout=False, stderr=True).decode('utf-8', errors='replace'),
+                "exit_code": exit_code
+            }
+            
+        except Exception as e:
+            logger.error(f"运行代码时出错: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        finally:
+            if container is not None:
+                try:
+                    container.remove(force=True)
+                except Exception as e:
+                    logger.error(f"删除容器时出错: {e}")
+    
+    async def close(self):
+        """关闭与容器之间复用的WebSocket连接"""
+        await self.websocket_client.aclose()
+    
     async def check_websocket_available(self) -> bool:
         """检查WebSocket服务是否可用
         
@@ -1,176 +1,193 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template
 import docker
-import psutil
+import orjson
+import os
+import sys
 import time
+import threading
+from datetime import datetime, timezone
+
+# 统计采集与根目录的monitor.py共用，直接运行本文件时项目根目录不在sys.path中
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from container_stats import StatsCollector
 
 app = Flask(__name__, template_folder='.')
 docker_client = docker.from_env()
 
-def get_container_info():
-    try:
-        containers = docker_client.containers.list(all=True)
-        if not containers:
-            print("未找到任何容器")
-            return []
-            
-        containers_info = []
-        status_map = {
-            'created': '已创建',
-            'running': '运行中',
-            'paused': '已暂停',
-            'restarting': '重启中',
-            'removing': '删除中',
-            'exited': '已停止',
-            'dead': '已死亡'
-        }
-        
-        for container in containers:
-            container_info = container.attrs
-            state = container_info.get('State', {})
-            status = state.get('Status', 'unknown')
-            display_status = status_map.get(status, status)
-            
-            # 计算运行时间
-            uptime = '-'
-            if status == 'running':
-                start_time = state.get('StartedAt')
-                if start_time:
-                    try:
-                        start_timestamp = time.strptime(start_time.split('.')[0], '%Y-%m-%dT%H:%M:%S')
-                        uptime_seconds = time.time() - time.mktime(start_timestamp)
-                        hours = int(uptime_seconds // 3600)
-                        minutes = int((uptime_seconds % 3600) // 60)
-                        uptime = f"{hours}小时{minutes}分钟" if hours > 0 else f"{minutes}分钟"
-                    except Exception as e:
-                        print(f"计算运行时间错误: {str(e)}")
-                        uptime = '-'
-            
-            containers_info.append({
-                'name': container.name,
-                'status': display_status,
-                'id': container.short_id,
-                'uptime': uptime
-            })
-            
-        return containers_info
-    except Exception as e:
-        print(f"获取容器信息错误: {str(e)}")
-        return []
+stats_collector = StatsCollector()
 
-def get_resource_usage():
-    """获取资源使用情况"""
-    print("开始获取资源使用情况...")
-    containers = docker_client.containers.list()
-    if not containers:
-        print("未找到运行中的容器")
-        return []
+# 状态快照的刷新间隔（秒）
+SNAPSHOT_INTERVAL = 2
+
+# 后台线程定期刷新的状态快照，/api/status 只读取它
+snapshot = {'ts': 0, 'data': None, 'error': None}
+_refresher_lock = threading.Lock()
+_refresher_started = False
+
+# 需要展示的容器状态，由Docker守护进程端过滤；可通过MONITOR_STATUSES环境变量（逗号分隔）覆盖
+WATCHED_STATUSES = os.environ.get('MONITOR_STATUSES', 'running,paused,restarting').split(',')
+
+STATUS_MAP = {
+    'created': '已创建',
+    'running': '运行中',
+    'paused': '已暂停',
+    'restarting': '重启中',
+    'removing': '删除中',
+    'exited': '已停止',
+    'dead': '已死亡'
+}
+
+def get_container_info(container):
+    """获取容器基本信息"""
+    state = container.attrs.get('State', {})
+    status = state.get('Status', 'unknown')
+    display_status = STATUS_MAP.get(status, status)
     
-    containers_resources = []
-    for container in containers:
-        try:
-            print(f"尝试获取容器统计信息，容器ID: {container.id}")
-            stats = container.stats(stream=False)
-            
-            if not stats:
-                print(f"警告：获取容器 {container.name} 统计信息失败")
-                continue
-            
-            # 计算CPU使用率
-            cpu_stats = stats.get('cpu_stats', {})
-            precpu_stats = stats.get('precpu_stats', {})
-            
-            cpu_usage = 0
+    # 计算运行时间
+    uptime = '-'
+    if status == 'running':
+        start_time = state.get('StartedAt')
+        if start_time:
             try:
-                cpu_delta = cpu_stats.get('cpu_usage', {}).get('total_usage', 0) - \
-                           precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
-                system_delta = cpu_stats.get('system_cpu_usage', 0) - \
-                              precpu_stats.get('system_cpu_usage', 0)
-                if system_delta > 0:
-                    num_cpus = len(cpu_stats.get('cpu_usage', {}).get('percpu_usage', [1]))
-                    cpu_usage = (cpu_delta / system_delta) * 100.0 * num_cpus
+                # StartedAt为UTC时间，小数部分为纳秒精度，直接去掉
+                start_dt = datetime.fromisoformat(start_time.split('.')[0]).replace(tzinfo=timezone.utc)
+                uptime_seconds = (datetime.now(timezone.utc) - start_dt).total_seconds()
+                hours = int(uptime_seconds // 3600)
+                minutes = int((uptime_seconds % 3600) // 60)
+                uptime = f"{hours}小时{minutes}分钟" if hours > 0 else f"{minutes}分钟"
             except Exception as e:
-                print(f"计算CPU使用率错误: {str(e)}")
-            
-            # 计算内存使用率
-            memory_stats = stats.get('memory_stats', {})
-            memory_usage = memory_stats.get('usage', 0)
-            memory_limit = memory_stats.get('limit', 0)
-            
-            memory_percent = 0
-            if memory_limit > 0:
-                memory_percent = (memory_usage / memory_limit) * 100.0
-            
-            containers_resources.append({
-                'id': container.short_id,
-                'name': container.name,
-                'cpu': round(cpu_usage, 1),
-                'memory': round(memory_percent, 1),
-                'memoryUsed': f"{memory_usage // (1024*1024)}MB",
-                'memoryLimit': f"{memory_limit // (1024*1024)}MB"
-            })
-        except Exception as e:
-            print(f"获取容器 {container.name} 资源使用情况错误: {str(e)}")
-            containers_resources.append({
-                'id': container.short_id,
-                'name': container.name,
-                'cpu': 0,
-                'memory': 0,
-                'memoryUsed': '0MB',
-                'memoryLimit': '0MB'
-            })
+                print(f"计算运行时间错误: {str(e)}")
+                uptime = '-'
     
-    return containers_resources
+    return {
+        'name': container.name,
+        'status': display_status,
+        'id': container.short_id,
+        'uptime': uptime
+    }
 
-def get_security_config():
+def get_resource_usage(container):
+    """获取资源使用情况"""
+    try:
+        # 统计流尚未收到采样时按0处理
+        stats = stats_collector.get(container) or {}
+        
+        # 计算CPU使用率
+        cpu_stats = stats.get('cpu_stats', {})
+        precpu_stats = stats.get('precpu_stats', {})
+        
+        cpu_usage = 0
+        try:
+            usage = cpu_stats.get('cpu_usage', {})
+            cpu_delta = usage.get('total_usage', 0) - \
+                       precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
+            system_delta = cpu_stats.get('system_cpu_usage', 0) - \
+                          precpu_stats.get('system_cpu_usage', 0)
+            if system_delta > 0:
+                # cgroup v2下没有percpu_usage，优先使用online_cpus
+                num_cpus = cpu_stats.get('online_cpus') or len(usage.get('percpu_usage') or [1])
+                cpu_usage = (cpu_delta / system_delta) * 100.0 * num_cpus
+        except Exception as e:
+            print(f"计算CPU使用率错误: {str(e)}")
+        
+        # 计算内存使用率
+        memory_stats = stats.get('memory_stats', {})
+        memory_usage = memory_stats.get('usage', 0)
+        memory_limit = memory_stats.get('limit', 0)
+        
+        memory_percent = 0
+        if memory_limit > 0:
+            memory_percent = (memory_usage / memory_limit) * 100.0
+        
+        return {
+            'cpu': round(cpu_usage, 1),
+            'memory': round(memory_percent, 1),
+            'memoryUsed': f"{memory_usage // (1024*1024)}MB",
+            'memoryLimit': f"{memory_limit // (1024*1024)}MB"
+        }
+    except Exception as e:
+        print(f"获取容器 {container.name} 资源使用情况错误: {str(e)}")
+        return {
+            'cpu': 0,
+            'memory': 0,
+            'memoryUsed': '0MB',
+            'memoryLimit': '0MB'
+        }
+
+def get_security_config(container):
     """获取安全配置状态"""
-    print("开始获取安全配置信息...")
     try:
-        containers = docker_client.containers.list()
-        if not containers:
-            print("未找到运行中的容器")
-            return []
+        host_config = container.attrs.get('HostConfig', {})
         
-        containers_security = []
-        for container in containers:
-            try:
-                print(f"尝试获取容器配置信息，容器ID: {container.id}")
-                container_info = container.attrs
-                
-                if not container_info:
-                    print(f"警告：获取容器 {container.name} 配置信息失败")
-                    continue
-                
-                # 检查只读文件系统
-                host_config = container_info.get('HostConfig', {})
-                read_only = host_config.get('ReadonlyRootfs', False)
-                
-                # 检查网络模式
-                network_mode = host_config.get('NetworkMode', 'bridge')
-                
-                # 检查能力限制
-                cap_drop = host_config.get('CapDrop', [])
-                
-                containers_security.append({
-                    'id': container.short_id,
-                    'name': container.name,
-                    'readOnly': read_only,
-                    'networkMode': network_mode,
-                    'capsDropped': len(cap_drop) > 0
-                })
-            except Exception as e:
-                print(f"获取容器 {container.name} 安全配置错误: {str(e)}")
-                containers_security.append({
-                    'id': container.short_id,
-                    'name': container.name,
-                    'readOnly': False,
-                    'networkMode': 'bridge',
-                    'capsDropped': False
-                })
+        # 检查只读文件系统
+        read_only = host_config.get('ReadonlyRootfs', False)
+        
+        # 检查网络模式
+        network_mode = host_config.get('NetworkMode', 'bridge')
         
-        return containers_security
+        # 检查能力限制
+        cap_drop = host_config.get('CapDrop') or []
+        
+        return {
+            'readOnly': read_only,
+            'networkMode': network_mode,
+            'capsDropped': len(cap_drop) > 0
+        }
+    except Exception as e:
+        print(f"获取容器 {container.name} 安全配置错误: {str(e)}")
+        return {
+            'readOnly': False,
+            'networkMode': 'bridge',
+            'capsDropped': False
+        }
+
+def collect(container):
+    """基于list()返回的attrs和缓存的统计信息，一次生成容器的完整记录"""
+    container_data = get_container_info(container)
+    # 资源和安全信息只对运行中的容器有意义
+    if container.status == 'running':
+        container_data.update(get_resource_usage(container))
+        container_data.update(get_security_config(container))
+    return container_data
+
+def collect_all():
+    """采集所有容器的完整状态信息"""
+    # 只向Docker请求一次容器列表，每个容器只处理一次
+    containers = docker_client.containers.list(all=True, filters={'status': WATCHED_STATUSES})
+    if not containers:
+        print("未找到任何容器")
+    return {
+        'containers': [collect(container) for container in containers]
+    }
+
+def refresh_snapshot():
+    """重新采集并整体替换状态快照"""
+    global snapshot
+    try:
+        snapshot = {'ts': time.time(), 'data': collect_all(), 'error': None}
     except Exception as e:
-        print(f"获取安全配置错误: {str(e)}")
-        return []
+        print(f"刷新状态快照错误: {str(e)}")
+        snapshot = {'ts': time.time(), 'data': None, 'error': f'获取状态信息失败: {str(e)}'}
+
+def refresher():
+    """后台定期刷新状态快照"""
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        refresh_snapshot()
+
+def ensure_refresher():
+    """首次请求时同步采集一次快照并启动后台刷新线程"""
+    global _refresher_started
+    with _refresher_lock:
+        if _refresher_started:
+            return
+        refresh_snapshot()
+        threading.Thread(target=refresher, daemon=True).start()
+        _refresher_started = True
+
+def ojsonify(obj):
+    """使用orjson序列化JSON响应，替代标准库实现的jsonify"""
+    return app.response_class(orjson.dumps(obj), mimetype='application/json')
 
 @app.route('/')
 def index():
@@ -179,43 +196,13 @@ def index():
 @app.route('/api/status')
 def get_status():
     """获取Docker容器的完整状态信息"""
-    try:
-        containers = get_container_info()
-        resources = get_resource_usage()
-        security = get_security_config()
-        
-        # 合并所有容器信息
-        container_list = []
-        for container in containers:
-            container_data = container.copy()
-            # 添加资源使用信息
-            resource = next((r for r in resources if r['id'] == container['id']), None)
-            if resource:
-                container_data.update({
-                    'cpu': resource['cpu'],
-                    'memory': resource['memory'],
-                    'memoryUsed': resource['memoryUsed'],
-                    'memoryLimit': resource['memoryLimit']
-                })
-            
-            # 添加安全配置信息
-            security_config = next((s for s in security if s['id'] == container['id']), None)
-            if security_config:
-                container_data.update({
-                    'readOnly': security_config['readOnly'],
-                    'networkMode': security_config['networkMode'],
-                    'capsDropped': security_config['capsDropped']
-                })
-            
-            container_list.append(container_data)
-        
-        return jsonify({
-            'containers': container_list
-        })
-    except Exception as e:
-        return jsonify({
-            'error': f'获取状态信息失败: {str(e)}'
+    ensure_refresher()
+    current = snapshot
+    if current['error']:
+        return ojsonify({
+            'error': current['error']
         }), 500
+    return ojsonify(current['data'])
 
 if __name__ == '__main__':
     """启动监控"""
@@ -0,0 +1,76 @@
+import unittest
+import asyncio
+import contextlib
+import io
+import orjson
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+from websocket_client import WebSocketClient
+
+async def interpreter_handler(websocket):
+    """模拟沙箱中的Interpreter服务：收到end帧后返回一段内容和完成状态"""
+    async for frame in websocket:
+        message = orjson.loads(frame)
+        if message.get("end"):
+            await websocket.send(orjson.dumps({"type": "message", "content": "Hello"}).decode())
+            await websocket.send(orjson.dumps({"type": "status", "content": "complete"}).decode())
+
+@unittest.skipIf(websockets is None, "websockets is not installed")
+class TestWebSocketClient(unittest.IsolatedAsyncioTestCase):
+    """测试WebSocketClient类"""
+
+    handler = staticmethod(interpreter_handler)
+
+    async def asyncSetUp(self):
+        """每个测试前启动本地WebSocket服务"""
+        self.connections = 0
+
+        async def counting_handler(websocket):
+            self.connections += 1
+            await self.handler(websocket)
+
+        self.server = await websockets.serve(counting_handler, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.client = WebSocketClient(f"ws://127.0.0.1:{port}", max_retries=1, timeout=5)
+
+    async def asyncTearDown(self):
+        """每个测试后关闭客户端和服务"""
+        await self.client.aclose()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def send(self, message):
+        """发送消息，丢弃实时输出"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            return await self.client.send_message(message)
+
+    async def test_consecutive_messages(self):
+        """测试同一个客户端连续发送两条消息"""
+        first = await self.send("1")
+        second = await self.send("2")
+        self.assertTrue(first["success"], first)
+        self.assertTrue(second["success"], second)
+        self.assertEqual(second["stdout"], "Hellocomplete")
+        # 第二条消息复用连接池中的连接
+        self.assertEqual(self.connections, 1)
+
+    async def test_non_text_content(self):
+        """测试字典内容和二进制帧与实时输出一样被转换为文本"""
+        async def handler(websocket):
+            async for frame in websocket:
+                if orjson.loads(frame).get("end"):
+                    await websocket.send(orjson.dumps({"type": "confirmation", "content": {"code": "1"}}).decode())
+                    await websocket.send(b"raw")
+                    await websocket.send(orjson.dumps({"type": "status", "content": "complete"}).decode())
+
+        self.handler = handler
+        result = await self.send("1")
+        self.assertTrue(result["success"], result)
+        self.assertEqual(result["stdout"], "{'code': '1'}rawcomplete")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,30 @@
 import logging
-import json
 import asyncio
-import time
+import os
+import sys
+import random
+from contextlib import nullcontext
 from typing import Dict, Any, Optional
+import orjson
 import websockets
+from websockets.protocol import State
+
+# 累计输出超过该字符数时才刷新stdout，减少流式输出时的write系统调用
+_FLUSH_THRESHOLD = 256
+
+# 每条消息都要发送的固定帧，在模块加载时序列化一次；
+# 服务端把二进制帧当作原始输入，因此解码为str以文本帧发送
+_AUTH_FRAME = orjson.dumps({"auth": True}).decode()
+_START_FRAME = orjson.dumps({"role": "user", "type": "message", "start": True}).decode()
+_END_FRAME = orjson.dumps({"role": "user", "type": "message", "end": True}).decode()
+
+def _to_text(value) -> str:
+    """把响应中的内容转换为可输出的文本，二进制帧按UTF-8解码，其他非字符串内容（如确认信息字典）使用str()"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
 
 # 设置日志
 logging.basicConfig(
@@ -15,12 +36,26 @@ logger = logging.getLogger("websocket_client")
 class WebSocketClient:
     """WebSocket客户端类，用于处理与服务器的通信"""
     
+    # 所有实例共享的握手并发限制，None表示不限制
+    _handshake_sem: Optional[asyncio.Semaphore] = None
+    
+    @classmethod
+    def set_handshake_limit(cls, limit: Optional[int]):
+        """限制同时进行的WebSocket握手数量，只约束握手阶段，不影响已建立的连接
+        
+        参数:
+            limit: 最大并发握手数，None或0表示不限制
+        """
+        cls._handshake_sem = asyncio.Semaphore(limit) if limit else None
+    
     def __init__(self, 
                  websocket_url: str,
                  max_retries: int = 10,
                  retry_delay: int = 2,
                  timeout: int = 30,
-                 debug: bool = False):
+                 debug: bool = False,
+                 pre_connect: int = 0,
+                 retry_cap: int = 30):
         """初始化WebSocket客户端
         
         参数:
@@ -29,12 +64,20 @@ class WebSocketClient:
             retry_delay: 重试延迟（秒）
             timeout: 超时时间（秒）
             debug: 是否启用调试模式
+            pre_connect: 调用warmup()时预先建立的连接数
+            retry_cap: 重试等待时间上限（秒）
         """
         self.websocket_url = websocket_url
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.retry_cap = retry_cap
         self.timeout = timeout
         self.debug = debug
+        self.pre_connect = pre_connect
+        # 空闲连接池：预热的连接和正常完成后归还的连接都放在这里跨消息复用
+        self._pool: asyncio.Queue = asyncio.Queue()
+        # 后台补充连接的任务，保留引用避免被垃圾回收
+        self._background_tasks = set()
         
         if debug:
             logger.setLevel(logging.DEBUG)
@@ -53,20 +96,120 @@ class WebSocketClient:
             
         for attempt in range(retries):
             try:
-                logger.info(f"尝试连接WebSocket: {self.websocket_url} (尝试 {attempt+1}/{retries})")
-                websocket = await websockets.connect(self.websocket_url)
+                logger.info("尝试连接WebSocket: %s (尝试 %d/%d)", self.websocket_url, attempt + 1, retries)
+                # 心跳由websockets库负责：每10秒ping一次，5秒内无pong则关闭连接；
+                # 消息都是小JSON帧，关闭permessage-deflate压缩以降低每帧开销
+                async with self._handshake_sem or nullcontext():
+                    websocket = await websockets.connect(
+                        self.websocket_url,
+                        compression=None,
+                        ping_interval=10,
+                        ping_timeout=5,
+                        close_timeout=2
+                    )
                 logger.info("WebSocket连接成功")
                 return websocket
             except Exception as e:
-                logger.error(f"WebSocket连接失败: {e}")
+                logger.error("WebSocket连接失败: %s", e)
                 if attempt < retries - 1:
-                    wait_time = self.retry_delay * (attempt + 1)
-                    logger.info(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
+                    # 指数退避加全量随机抖动，避免多个客户端同时重连
+                    wait_time = random.uniform(0, min(self.retry_cap, self.retry_delay * (2 ** attempt)))
+                    logger.info("等待 %.1f 秒后重试...", wait_time)
+                    await asyncio.sleep(wait_time)
                 else:
-                    logger.error(f"WebSocket连接失败，已达到最大重试次数: {retries}")
+                    logger.error("WebSocket连接失败，已达到最大重试次数: %d", retries)
                     return None
     
+    async def warmup(self):
+        """预先建立pre_connect个连接放入连接池，避免首批消息等待握手"""
+        if self.pre_connect <= 0:
+            return
+        connections = await asyncio.gather(*[self.connect(retries=1) for _ in range(self.pre_connect)])
+        for websocket in connections:
+            if websocket:
+                self._pool.put_nowait(websocket)
+        logger.info("WebSocket连接池预热完成: %d/%d", self._pool.qsize(), self.pre_connect)
+    
+    async def _replenish(self):
+        """补充一个连接到连接池"""
+        websocket = await self.connect(retries=1)
+        if websocket:
+            self._pool.put_nowait(websocket)
+    
+    async def _get_ws(self) -> Optional[websockets.WebSocketClientProtocol]:
+        """从连接池取出可用连接，没有可用连接时重新连接
+        
+        返回:
+            WebSocket连接对象，如果连接失败则返回None
+        """
+        while not self._pool.empty():
+            websocket = self._pool.get_nowait()
+            # 用state判断连接状态，新旧两套客户端实现都支持；legacy客户端的.open在新实现中不存在
+            if websocket.state is State.OPEN:
+                return websocket
+            # 已失效的连接直接关闭丢弃
+            try:
+                await websocket.close()
+            except Exception as e:
+                logger.debug("关闭失效的WebSocket连接时出错: %s", e)
+        return await self.connect()
+    
+    async def _send_frames(self, websocket, frames):
+        """依次发送已序列化的消息帧"""
+        for frame in frames:
+            await websocket.send(frame)
+    
+    async def _receive_responses(self, websocket, responses, output) -> bool:
+        """接收响应并实时输出，直到收到完成状态
+        
+        参数:
+            websocket: WebSocket连接对象
+            responses: 用于收集响应的列表
+            output: 用于收集已输出文本的列表，与实时输出的内容一致
+            
+        返回:
+            是否收到完成状态
+        """
+        out_write = sys.stdout.write
+        out_flush = sys.stdout.flush
+        pending = 0
+        try:
+            while True:
+                response = await websocket.recv()
+                
+                # 只有以"{"开头的帧才尝试解析，普通文本帧不必经过异常处理
+                response_data = None
+                if response[:1] in ("{", b"{"):
+                    try:
+                        response_data = orjson.loads(response)
+                    except orjson.JSONDecodeError as e:
+                        logger.error("JSON解析错误: %s", e)
+                if not isinstance(response_data, dict):
+                    responses.append({"text": response})
+                    text = response
+                else:
+                    responses.append(response_data)
+                    # 实时处理消息内容
+                    text = response_data.get("content")
+                
+                # 写入stdout缓冲区，攒够一定字符数或遇到换行再刷新
+                if text is not None:
+                    text = _to_text(text)
+                    output.append(text)
+                    out_write(text)
+                    pending += len(text)
+                    if pending > _FLUSH_THRESHOLD or "\n" in text:
+                        out_flush()
+                        pending = 0
+                
+                # 检查消息完成状态
+                if isinstance(response_data, dict) and response_data.get("type") == "status":
+                    if response_data.get("content") == "complete":
+                        return True
+        finally:
+            # 结束（完成、出错或超时）时把剩余内容刷新出去
+            out_flush()
+    
     async def send_message(self, message: str) -> Dict[str, Any]:
         """发送消息到WebSocket服务器
         
@@ -77,110 +220,52 @@ class WebSocketClient:
             包含执行结果的字典
         """
         websocket = None
+        connection_active = True
+        message_complete = False
         try:
-            # 连接WebSocket
-            websocket = await self.connect()
+            websocket = await self._get_ws()
             if not websocket:
                 return {
                     "success": False,
                     "error": "无法连接到WebSocket服务"
                 }
             
-            # 发送用户消息
-            messages = [
-                {"auth": True},
-                {"role": "user", "type": "message", "start": True},
-                {"role": "user", "type": "message", "content": message},
-                {"role": "user", "type": "message", "end": True}
+            # 发送用户消息：服务端按单条JSON消息解析，不能合并成一帧；
+            # 固定帧已预先序列化，每次只需编码内容帧
+            frames = [
+                _AUTH_FRAME,
+                _START_FRAME,
+                orjson.dumps({"role": "user", "type": "message", "content": message}).decode(),
+                _END_FRAME
             ]
+            logger.debug("Sending messages: %s", frames)
             
-            try:
-                for msg in messages:
-                    if self.debug:
-                        logger.debug(f"Sending message: {msg}")
-                    await websocket.send(json.dumps(msg))
-            except websockets.exceptions.ConnectionClosed:
-                logger.error("WebSocket连接在发送消息时关闭")
-                return {
-                    "success": False,
-                    "error": "WebSocket连接在发送消息时关闭"
-                }
-            
-            # 接收响应
+            # 发送和接收并发进行，首个响应帧不必等所有帧发送完毕；
+            # 整个过程共用一个截止时间，不再为每次recv创建超时任务
             responses = []
-            current_response = ""
-            connection_active = True
-            message_complete = False
-            start_time = time.time()
-            last_activity_time = time.time()
-            
-            while connection_active:
-                try:
-                    # 添加超时保护
-                    current_time = time.time()
-                    if current_time - start_time > self.timeout:
-                        logger.warning(f"接收消息超时 ({self.timeout}秒)")
-                        break
-                    
-                    # 检查最后活动时间
-                    if current_time - last_activity_time > 10:  # 10秒无活动则发送心跳
-                        try:
-                            await websocket.ping()
-                            last_activity_time = current_time
-                        except Exception as e:
-                            logger.error(f"发送心跳失败: {e}")
-                            break
-                    
-                    # 设置接收超时
-                    try:
-                        response = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                        last_activity_time = time.time()  # 更新最后活动时间
-                        response_data = json.loads(response)
-                        responses.append(response_data)
-                        
-                        # 实时处理消息内容
-                        if "content" in response_data:
-                            current_response = response_data["content"]
-                            print(current_response, end="", flush=True)
-                        
-                        # 检查消息完成状态
-                        if response_data.get("type") == "status":
-                            if response_data.get("content") == "complete":
-                                message_complete = True
-                                
-                        # 消息完成时不关闭连接，保持连接状态以支持后续对话
-                        if message_complete:
-                            break  # 仅退出当前消息的接收循环
-                        
-                    except asyncio.TimeoutError:
-                        continue
-                    except json.JSONDecodeError as e:
-                        logger.error(f"JSON解析错误: {e}")
-                        responses.append({"text": response})
-                        print(response, end="", flush=True)
-                    except websockets.exceptions.ConnectionClosed:
-                        logger.error("WebSocket连接已关闭")
-                        return {
-                            "success": False,
-                            "error": "WebSocket连接已关闭"
-                        }
-                    except Exception as e:
-                        logger.error(f"接收消息时出错: {e}")
-                        connection_active = False
-                        break
-                        
-                except Exception as e:
-                    logger.error(f"消息处理循环出错: {e}")
-                    connection_active = False
-                    break
+            output = []
+            try:
+                async with asyncio.timeout(self.timeout):
+                    async with asyncio.TaskGroup() as tg:
+                        tg.create_task(self._send_frames(websocket, frames))
+                        receiver = tg.create_task(self._receive_responses(websocket, responses, output))
+                # 消息完成时不关闭连接，保持连接状态以支持后续对话
+                message_complete = receiver.result()
+            except TimeoutError:
+                logger.warning("接收消息超时 (%s秒)", self.timeout)
+            except ExceptionGroup as eg:
+                connection_active = False
+                if eg.subgroup(websockets.exceptions.ConnectionClosed):
+                    logger.error("WebSocket连接已关闭")
+                    return {
+                        "success": False,
+                        "error": "WebSocket连接已关闭"
+                    }
+                logger.error("接收消息时出错: %s", eg.exceptions[0])
             
             # 返回完整响应
-            full_response = ""
-            for resp in responses:
-                if "content" in resp:
-                    full_response += resp["content"]
-                elif "text" in resp:
-                    full_response += resp["text"]
+            # 使用接收时已转换并输出的文本一次拼接，避免字符串反复+=带来的O(n²)复制
+            full_response = "".join(output)
             
             return {
                 "success": True,
@@ -191,30 +276,51 @@ class WebSocketClient:
             
         except websockets.exceptions.ConnectionClosed:
             logger.error("WebSocket连接已关闭")
+            connection_active = False
             return {
                 "success": False,
                 "error": "WebSocket连接已关闭"
             }
         except Exception as e:
-            logger.error(f"WebSocket通信出错: {e}")
+            logger.error("WebSocket通信出错: %s", e)
+            connection_active = False
             return {
                 "success": False,
                 "error": str(e)
             }
         finally:
             # 在finally块中关闭WebSocket连接
-            if websocket:
+            if websocket and connection_active and message_complete:
+                # 正常完成时归还连接池，供下一条消息复用
+                self._pool.put_nowait(websocket)
+            elif websocket:
+                # 出错或未收到完成状态时关闭连接
                 try:
-                    # 只有在消息处理完成或发生错误时才关闭连接
-                    if message_complete or not connection_active:
-                        await websocket.close()
-                        logger.debug("WebSocket连接已正常关闭")
+                    await websocket.close()
+                    logger.debug("WebSocket连接已正常关闭")
                 except Exception as e:
-                    logger.error(f"关闭WebSocket连接时出错: {e}")
+                    logger.error("关闭WebSocket连接时出错: %s", e)
+                # 启用预热时在后台补充连接，保持连接池可用
+                if self.pre_connect > 0:
+                    task = asyncio.create_task(self._replenish())
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._background_tasks.discard)
             
             # WebSocket连接清理完成
             logger.debug("WebSocket资源已清理完成")
     
+    async def aclose(self):
+        """关闭连接池中的所有WebSocket连接"""
+        for task in list(self._background_tasks):
+            task.cancel()
+        while not self._pool.empty():
+            websocket = self._pool.get_nowait()
+            try:
+                await websocket.close()
+                logger.debug("WebSocket连接已关闭")
+            except Exception as e:
+                logger.error("关闭WebSocket连接时出错: %s", e)
+    
     async def check_available(self) -> bool:
         """检查WebSocket服务是否可用
         
@@ -222,11 +328,17 @@ class WebSocketClient:
             WebSocket服务是否可用
         """
         try:
-            # 尝试连接WebSocket，设置较短的超时时间
-            websocket = await websockets.connect(self.websocket_url, timeout=3)
-            await websocket.close()
-            logger.debug("WebSocket服务可用")
-            return True
+            # 尝试连接WebSocket，设置较短的超时时间；上下文管理器保证连接一定被关闭
+            async with websockets.connect(self.websocket_url, open_timeout=3, close_timeout=1, compression=None):
+                logger.debug("WebSocket服务可用")
+                return True
         except Exception as e:
-            logger.debug(f"WebSocket服务不可用: {e}")
-            return False
\ No newline at end of file
+            logger.debug("WebSocket服务不可用: %s", e)
+            return False
+
+# 可通过环境变量设置默认的握手并发上限；取值无效时只记录警告，不影响模块导入
+if os.environ.get("WS_MAX_CONCURRENT_HANDSHAKES"):
+    try:
+        WebSocketClient.set_handshake_limit(int(os.environ["WS_MAX_CONCURRENT_HANDSHAKES"]))
+    except ValueError:
+        logger.warning("忽略无效的WS_MAX_CONCURRENT_HANDSHAKES: %r", os.environ["WS_MAX_CONCURRENT_HANDSHAKES"])
\ No newline at end of file